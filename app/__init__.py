@@ -1,13 +1,35 @@
+import orjson
 from fastapi import Request, Response, status
-from fastapi.responses import ORJSONResponse
-from pydantic import BaseModel, Field
+from fastapi.utils import is_body_allowed_for_status_code
+from starlette.exceptions import HTTPException
+# pydantic only accepts typing_extensions.TypedDict on Python < 3.12
+from typing_extensions import TypedDict
 
-class CommonResponse(BaseModel):
-    message: str = Field(...)
+class CommonResponse(TypedDict):
+    message: str
+
+
+# pre-encoded body, so the handler doesn't build and validate a model on every 500
+_ERROR_BODY = orjson.dumps(CommonResponse(message="error"))
 
 
 async def general_exception_handler(req: Request, exc: Exception) -> Response:
-    return ORJSONResponse(
+    return Response(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content=CommonResponse(message= "error").model_dump()
-    )
\ No newline at end of file
+        content=_ERROR_BODY,
+        media_type="application/json",
+    )
+
+
+async def http_exception_handler(req: Request, exc: HTTPException) -> Response:
+    # same as FastAPI's default JSON handler, but encoded with orjson
+    headers = getattr(exc, "headers", None)
+    if not is_body_allowed_for_status_code(exc.status_code):
+        return Response(status_code=exc.status_code, headers=headers)
+    return Response(
+        status_code=exc.status_code,
+        # stdlib json accepts non-str dict keys in detail, so orjson has to as well
+        content=orjson.dumps({"detail": exc.detail}, option=orjson.OPT_NON_STR_KEYS),
+        media_type="application/json",
+        headers=headers,
+    )
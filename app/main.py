@@ -1,7 +1,11 @@
-from fastapi import FastAPI, status, HTTPException, Depends
+import os
+
+import orjson
+from fastapi import FastAPI, Response, status, HTTPException, Depends
 from fastapi.responses import ORJSONResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from app import CommonResponse
+from app import CommonResponse, general_exception_handler, http_exception_handler
 
 
 app = FastAPI(
@@ -20,26 +24,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=int(os.getenv("CORS_MAX_AGE", "86400")),
 )
 
 ###############
 # normal case #
 ###############
-@app.get("/health", status_code=status.HTTP_200_OK, response_model=CommonResponse)
+_HEALTH_BODY = orjson.dumps({"message": "I'm healthy!"})
+
+@app.get("/health", status_code=status.HTTP_200_OK)
 async def is_health():
-    return CommonResponse(message= "I'm healthy!")
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 ##################
 # exception case #
 ##################
-@app.get("/exception", response_model=CommonResponse)
+@app.get("/exception")
 async def throws_exception():
     raise Exception("No!")
 
 #######################
 # http exception case #
 #######################
-@app.get("/exception/http", response_model=CommonResponse)
+@app.get("/exception/http")
 async def throws_http_exception():
     raise HTTPException(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -52,7 +59,7 @@ async def throws_http_exception():
 async def dependency_exception() -> str:
     raise Exception("Exception raised in dependency!")
     
-@app.get("/exception/depend", response_model=CommonResponse)
+@app.get("/exception/depend")
 async def throws_exception_in_depend(
     the_thing = Depends(dependency_exception)
 ):    
@@ -67,14 +74,12 @@ async def dependency_exception_http() -> str:
         detail="Go! HttpException!"
     )
     
-@app.get("/exception/http/depend", response_model=CommonResponse)
+@app.get("/exception/http/depend")
 async def throws_exception_in_depend(
     the_thing = Depends(dependency_exception_http)
 ):    
     return CommonResponse(message="how come")
 
 
-
-from app import general_exception_handler
-
-app.add_exception_handler(Exception, general_exception_handler)
\ No newline at end of file
+app.add_exception_handler(StarletteHTTPException, http_exception_handler)
+app.add_exception_handler(Exception, general_exception_handler)
@@ -1,15 +1,105 @@
 import logging
 
+import orjson
 from starlette.middleware.cors import CORSMiddleware as StarletteCORSMiddleware
-from starlette.datastructures import Headers, MutableHeaders
-from starlette.responses import JSONResponse
-from starlette.types import Message, Send
-
-from app import CommonResponse
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Send
 
 logger = logging.getLogger(__name__)
 
+# encoded once at import time, the except branch only wraps these bytes
+_ERROR_BODY = orjson.dumps({"message": "error!!"})
+_VARY_ORIGIN = (b"vary", b"Origin")
+# upper bound on remembered origins, the cache is dropped once it fills up
+_ORIGIN_CACHE_CAP = 512
+# same for the encoded preflight responses, keyed on the request signature
+_PREFLIGHT_CACHE_CAP = 256
+
 class CORSMiddleware(StarletteCORSMiddleware):
+    def __init__(self, app: ASGIApp, *, max_age: int = 86400, **kwargs) -> None:
+        # A day-long Access-Control-Max-Age lets browsers skip repeated preflights.
+        super().__init__(app, max_age=max_age, **kwargs)
+        # simple_headers never change after construction, so encode them once.
+        self._simple_headers_raw = [
+            (key.lower().encode("latin-1"), value.encode("latin-1"))
+            for key, value in self.simple_headers.items()
+        ]
+        # When the origin is mirrored back, the wildcard allow-origin is replaced.
+        self._explicit_headers_raw = [
+            (key, value)
+            for key, value in self._simple_headers_raw
+            if key != b"access-control-allow-origin"
+        ]
+        # Header names we set, any value the downstream app already sent for them is
+        # replaced (as MutableHeaders.update did) rather than duplicated.
+        self._simple_header_keys = frozenset(key for key, _ in self._simple_headers_raw)
+        self._explicit_header_keys = frozenset(
+            [key for key, _ in self._explicit_headers_raw] + [b"access-control-allow-origin"]
+        )
+        self._origin_cache: dict[str, bool] = {}
+        self._preflight_cache: dict[tuple[str, str, str | None, str | None], tuple[int, list, bytes]] = {}
+        # Specialize the "mirror back the origin?" predicate for this configuration,
+        # so the per-request path doesn't re-check the same flags.
+        if not self.allow_all_origins:
+            self._explicit_origin = self._explicit_if_allowed
+        elif self.allow_credentials:
+            self._explicit_origin = self._explicit_if_cookie
+        else:
+            # Without credentials the wildcard is always enough.
+            self._explicit_origin = self._never_explicit
+
+    def _allowed(self, origin: str) -> bool:
+        """
+        Cached is_allowed_origin, real traffic only sees a handful of origins.
+        """
+        allowed = self._origin_cache.get(origin)
+        if allowed is None:
+            allowed = self.is_allowed_origin(origin)
+            if len(self._origin_cache) >= _ORIGIN_CACHE_CAP:
+                self._origin_cache.clear()
+            self._origin_cache[origin] = allowed
+        return allowed
+
+    def _explicit_if_allowed(self, origin: str, has_cookie: bool) -> bool:
+        return self._allowed(origin)
+
+    @staticmethod
+    def _explicit_if_cookie(origin: str, has_cookie: bool) -> bool:
+        return has_cookie
+
+    @staticmethod
+    def _never_explicit(origin: str, has_cookie: bool) -> bool:
+        return False
+
+    async def _send_preflight(self, request_headers: Headers, send: Send) -> None:
+        """
+        Send the preflight response, reusing the encoded one for a repeated signature.
+        """
+        key = (
+            request_headers["origin"],
+            request_headers["access-control-request-method"],
+            # keep None, an absent header and an empty one get different responses
+            request_headers.get("access-control-request-headers"),
+            request_headers.get("access-control-request-private-network"),
+        )
+        cached = self._preflight_cache.get(key)
+        if cached is None:
+            response = self.preflight_response(request_headers=request_headers)
+            cached = (response.status_code, response.raw_headers, response.body)
+            if len(self._preflight_cache) >= _PREFLIGHT_CACHE_CAP:
+                self._preflight_cache.clear()
+            self._preflight_cache[key] = cached
+
+        status_code, raw_headers, body = cached
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            # copy, so anything further down the stack can't mutate the cached list
+            "headers": list(raw_headers),
+        })
+        await send({"type": "http.response.body", "body": body})
+
     async def __call__(self, scope, receive, send):
         # If the scope type is not "http", simply call the app.
         if scope["type"] != "http":
@@ -17,49 +107,84 @@ class CORSMiddleware(StarletteCORSMiddleware):
             return
 
         method = scope["method"]
-        headers = Headers(scope=scope)
-        origin = headers.get("origin")
+        # Scan the raw headers once for the only two keys we need,
+        # instead of building a Headers object on every request.
+        origin = None
+        origin_raw = b""
+        has_cookie = False
+        for key, value in scope["headers"]:
+            # first Origin wins, same as Headers.get and the preflight branch
+            if key == b"origin" and origin is None:
+                origin_raw = value
+                origin = value.decode("latin-1")
+            elif key == b"cookie":
+                has_cookie = True
 
         if origin is None:
             await self.app(scope, receive, send)
             return
         # Handle preflight requests.
-        if method == "OPTIONS" and "access-control-request-method" in headers:
-            response = self.preflight_response(request_headers=headers)
-            await response(scope, receive, send)
-            return
+        if method == "OPTIONS":
+            headers = Headers(scope=scope)
+            if "access-control-request-method" in headers:
+                await self._send_preflight(headers, send)
+                return
         
-        # Define a send_wrapper closure (capturing headers and origin).
-        async def send_wrapper(message: Message) -> Send:
+        # Decide once, before dispatching, which CORS headers this response needs.
+        explicit_origin = self._explicit_origin(origin, has_cookie)
+
+        async def send_simple(message: Message) -> None:
             """
-            Additional implementation code.
+            Add only the simple CORS headers to the response start message.
             """
             if message["type"] == "http.response.start":
-                message.setdefault("headers", [])
-                mutable_headers = MutableHeaders(scope=message)
-                mutable_headers.update(self.simple_headers)
-                if self.allow_all_origins and "cookie" in headers:
-                    self.allow_explicit_origin(mutable_headers, origin)
-                elif not self.allow_all_origins and self.is_allowed_origin(origin):
-                    self.allow_explicit_origin(mutable_headers, origin)
+                # ASGI allows any iterable here, so rebuild it as a list without our keys.
+                headers_list = message["headers"] = [
+                    (key, value)
+                    for key, value in message.get("headers", ())
+                    if key not in self._simple_header_keys
+                ]
+                headers_list.extend(self._simple_headers_raw)
             await send(message)
 
+        async def send_explicit_origin(message: Message) -> None:
+            """
+            Add the simple CORS headers and mirror back the request origin.
+            """
+            if message["type"] == "http.response.start":
+                headers_list = message["headers"] = [
+                    (key, value)
+                    for key, value in message.get("headers", ())
+                    if key not in self._explicit_header_keys
+                ]
+                headers_list.extend(self._explicit_headers_raw)
+                headers_list.append((b"access-control-allow-origin", origin_raw))
+                headers_list.append(_VARY_ORIGIN)
+            await send(message)
+
+        if explicit_origin:
+            send_wrapper = send_explicit_origin
+        elif self._simple_headers_raw:
+            send_wrapper = send_simple
+        else:
+            # Nothing to add, so pass the messages straight through.
+            send_wrapper = send
+
         # Wrap the send() call to add CORS headers to the actual response.
         try:
             await self.app(scope, receive, send_wrapper)
         except Exception as exc:
-            logger.exception(exc)
-            response = JSONResponse(
+            # The exception is swallowed here, so this is the only record of it; keep the traceback.
+            logger.exception("downstream failed: %r", exc)
+            response = Response(
                 status_code=500,
-                content=CommonResponse(message="error!!").model_dump()
+                content=_ERROR_BODY,
+                media_type="application/json",
             )
 
             # When an exception occurs, create a response similar to that returned
             # by the exception handler and add the CORS headers.
-            for key, value in self.simple_headers.items():
-                response.headers[key] = value
-            if self.allow_all_origins and "cookie" in headers:
-                self.allow_explicit_origin(response.headers, origin)
-            elif not self.allow_all_origins and self.is_allowed_origin(origin):
+            response.raw_headers.extend(self._simple_headers_raw)
+            if explicit_origin:
                 self.allow_explicit_origin(response.headers, origin)
             await response(scope, receive, send)
@@ -1,13 +1,15 @@
+import httpx
 import pytest
 from fastapi import FastAPI, HTTPException, status, Depends
 from fastapi.responses import ORJSONResponse
-from fastapi.testclient import TestClient
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.middleware.cors import CORSMiddleware as StarletteCORSMiddleware
 
 # Import CustomCORSMiddleware (adjust the import path as necessary)
 from app.middleware.cors import CORSMiddleware as CustomCORSMiddleware
 from app import CommonResponse
 from app import general_exception_handler
+from app import http_exception_handler
 
 ORIGIN_HEADER = {"Origin": "https://google.com"}
 CORS_RESPONSE_HEADER = "access-control-allow-origin"
@@ -48,6 +50,13 @@ def create_app(middleware_class):
             detail="HTTPException occurred!"
         )
 
+    @app.get("/exception/http/detail")
+    async def throws_http_exception_with_int_keys():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={1: "a"}
+        )
+
     ###########################################
     # Exception in dependency (general case)  #
     ###########################################
@@ -71,56 +80,100 @@ def create_app(middleware_class):
     async def throws_exception_in_depend_http(the_thing: str = Depends(dependency_exception_http)):
         return CommonResponse(message="You should never see this either")
 
+    app.add_exception_handler(StarletteHTTPException, http_exception_handler)
     app.add_exception_handler(Exception, general_exception_handler)
 
     return app
 
+async def ok_app(scope, receive, send):
+    """
+    Minimal ASGI app for tests that configure CustomCORSMiddleware directly.
+    """
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"OK"})
+
+MIDDLEWARE_TYPES = {StarletteCORSMiddleware: "default", CustomCORSMiddleware: "custom"}
+
+# Run the async tests on asyncio through anyio's pytest plugin; module scope so
+# the module-scoped client fixture below can use it.
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
 # Create a pytest fixture that parameterizes the middleware used by the app.
-@pytest.fixture(params=[
+# The app and client are built once per middleware and shared by the module's tests.
+@pytest.fixture(scope="module", params=[
     pytest.param(StarletteCORSMiddleware, id="default"),
     pytest.param(CustomCORSMiddleware, id="custom")
 ])
-def client(request) -> TestClient:
+async def client(request, anyio_backend) -> httpx.AsyncClient:
     middleware_class = request.param
     app = create_app(middleware_class)
     # Prevent re-raising exceptions so that the exception handler's response is returned.
-    client_instance = TestClient(app, raise_server_exceptions=False)
-    # Attach the middleware type to the TestClient instance.
-    client_instance.middleware_type = request.node.callspec.id  # "default" or "custom"
-    return client_instance
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client_instance:
+        # Attach the middleware type to the client instance.
+        client_instance.middleware_type = MIDDLEWARE_TYPES[middleware_class]  # "default" or "custom"
+        yield client_instance
 
 ###############
 # Test Cases#
 ###############
 
-def test_health(client: TestClient):
+@pytest.mark.anyio
+async def test_health(client: httpx.AsyncClient):
     """
     Test the /health endpoint to verify that a normal response includes CORS headers.
     """
-    response = client.get("/health", headers=ORIGIN_HEADER)
+    response = await client.get("/health", headers=ORIGIN_HEADER)
     assert response.status_code == 200
     # Verify that the CORS header is present.
     assert response.headers.get(CORS_RESPONSE_HEADER) is not None
 
-def test_http_exception(client: TestClient):
+@pytest.mark.anyio
+async def test_http_exception(client: httpx.AsyncClient):
     """
     Test the /exception/http endpoint to verify that HTTPExceptions include CORS headers.
     """
-    response = client.get("/exception/http", headers=ORIGIN_HEADER)
+    response = await client.get("/exception/http", headers=ORIGIN_HEADER)
     # We expect a 500 error and the CORS header to be present.
     assert response.status_code == 500
+    assert response.json() == {"detail": "HTTPException occurred!"}
     assert response.headers.get(CORS_RESPONSE_HEADER) is not None
 
-def test_http_exception_in_dependency(client: TestClient):
+@pytest.mark.anyio
+async def test_http_exception_with_non_str_keys(client: httpx.AsyncClient):
+    """
+    Test that an HTTPException detail with non-string dict keys is still
+    rendered, as FastAPI's own handler does.
+    """
+    response = await client.get("/exception/http/detail", headers=ORIGIN_HEADER)
+    assert response.status_code == 400
+    assert response.json() == {"detail": {"1": "a"}}
+
+@pytest.mark.anyio
+async def test_not_found(client: httpx.AsyncClient):
+    """
+    Test that router 404s (starlette's HTTPException) go through the orjson
+    HTTPException handler too.
+    """
+    response = await client.get("/missing", headers=ORIGIN_HEADER)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Not Found"}
+    assert response.headers.get(CORS_RESPONSE_HEADER) is not None
+
+@pytest.mark.anyio
+async def test_http_exception_in_dependency(client: httpx.AsyncClient):
     """
     Test that HTTPExceptions raised in dependency functions are caught and that
     the resulting error responses include CORS headers.
     """
-    response = client.get("/exception/http/depend", headers=ORIGIN_HEADER)
+    response = await client.get("/exception/http/depend", headers=ORIGIN_HEADER)
     assert response.status_code == 500
     assert response.headers.get(CORS_RESPONSE_HEADER) is not None
 
-def test_exception(client: TestClient):
+@pytest.mark.anyio
+async def test_exception(client: httpx.AsyncClient):
     """
     Test the /exception endpoint to verify that error responses (general exceptions)
     behave as expected:
@@ -128,7 +181,7 @@ def test_exception(client: TestClient):
         - For custom middleware: CORS header is present.
     """
     middleware_type = client.middleware_type
-    response = client.get("/exception", headers=ORIGIN_HEADER)
+    response = await client.get("/exception", headers=ORIGIN_HEADER)
     # Expect a 500 status code for general exceptions.
     assert response.status_code == 500
 
@@ -143,13 +196,14 @@ def test_exception(client: TestClient):
             "Expected CORS header for custom middleware when a general exception occurs"
         )
         
-def test_exception_in_dependency(client: TestClient): 
+@pytest.mark.anyio
+async def test_exception_in_dependency(client: httpx.AsyncClient): 
     """
     Test that exceptions raised in dependency functions are caught and that
     the resulting error responses include CORS headers.
     """
     middleware_type = client.middleware_type
-    response = client.get("/exception/depend", headers=ORIGIN_HEADER)
+    response = await client.get("/exception/depend", headers=ORIGIN_HEADER)
     # Expect a 500 status code for general exceptions.
     assert response.status_code == 500
 
@@ -161,3 +215,167 @@ def test_exception_in_dependency(client: TestClient):
         assert response.headers.get(CORS_RESPONSE_HEADER) is not None, (
             "Expected CORS header for custom middleware when a general exception occurs"
         )
+
+@pytest.mark.anyio
+async def test_health_with_cookie(client: httpx.AsyncClient):
+    """
+    Test that a credentialed request (with a cookie) gets the request origin
+    mirrored back instead of the wildcard.
+    """
+    # Send the cookie per request, the client is shared across the module.
+    response = await client.get("/health", headers={**ORIGIN_HEADER, "Cookie": "session=abc"})
+    assert response.status_code == 200
+    assert response.headers.get(CORS_RESPONSE_HEADER) == ORIGIN_HEADER["Origin"]
+    assert "Origin" in response.headers.get("vary", "")
+
+@pytest.mark.anyio
+async def test_allow_list_origins():
+    """
+    Test that with an allow-list CustomCORSMiddleware mirrors back allowed
+    origins and leaves others without an allow-origin header, including on
+    repeated requests from the same origin.
+    """
+    origin = ORIGIN_HEADER["Origin"]
+    middleware = CustomCORSMiddleware(app=ok_app, allow_origins=[origin])
+    transport = httpx.ASGITransport(app=middleware)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        for _ in range(2):
+            allowed = await client.get("/", headers=ORIGIN_HEADER)
+            assert allowed.headers.get(CORS_RESPONSE_HEADER) == origin
+
+            other = await client.get("/", headers={"Origin": "https://example.com"})
+            assert other.headers.get(CORS_RESPONSE_HEADER) is None
+
+@pytest.mark.anyio
+async def test_preflight(client: httpx.AsyncClient):
+    """
+    Test that preflight requests are answered by the middleware, and that a
+    repeated preflight gets the same response.
+    """
+    preflight_headers = {
+        **ORIGIN_HEADER,
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "X-Custom",
+    }
+    first = await client.options("/health", headers=preflight_headers)
+    second = await client.options("/health", headers=preflight_headers)
+    for response in (first, second):
+        assert response.status_code == 200
+        assert response.text == "OK"
+        assert response.headers.get(CORS_RESPONSE_HEADER) == ORIGIN_HEADER["Origin"]
+        assert response.headers.get("access-control-allow-headers") == "X-Custom"
+
+    expected_max_age = "600" if client.middleware_type == "default" else "86400"
+    assert first.headers.get("access-control-max-age") == expected_max_age
+
+@pytest.mark.anyio
+async def test_preflight_cache_keeps_absent_and_empty_headers_apart():
+    """
+    Test that a preflight with an empty Access-Control-Request-Headers doesn't
+    share a cache entry with one that leaves the header out, and that repeated
+    preflights keep getting the same response.
+    """
+    origin = "https://a.com"
+    middleware = CustomCORSMiddleware(app=FastAPI(), allow_origins=[origin], allow_headers=["x-foo"])
+    transport = httpx.ASGITransport(app=middleware)
+    preflight_headers = {"Origin": origin, "Access-Control-Request-Method": "GET"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        empty_headers = {**preflight_headers, "Access-Control-Request-Headers": ""}
+        empty = await client.options("/health", headers=empty_headers)
+        assert empty.status_code == 400
+
+        first = await client.options("/health", headers=preflight_headers)
+        assert first.status_code == 200
+        assert first.text == "OK"
+
+        second = await client.options("/health", headers=preflight_headers)
+        assert (second.status_code, second.headers, second.text) == (first.status_code, first.headers, first.text)
+
+        empty_again = await client.options("/health", headers=empty_headers)
+        assert empty_again.status_code == 400
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("cookie", [False, True], ids=["simple", "explicit-origin"])
+async def test_tuple_response_headers(cookie: bool):
+    """
+    Test that CustomCORSMiddleware accepts a raw ASGI app that sends its
+    response headers as a tuple instead of a list.
+    """
+    async def raw_app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": ((b"content-type", b"text/plain"),),
+        })
+        await send({"type": "http.response.body", "body": b"OK"})
+
+    middleware = CustomCORSMiddleware(app=raw_app, allow_origins=["*"], allow_credentials=True)
+    transport = httpx.ASGITransport(app=middleware)
+    headers = {**ORIGIN_HEADER, "Cookie": "session=abc"} if cookie else ORIGIN_HEADER
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.get("/", headers=headers)
+
+    assert response.status_code == 200
+    assert response.text == "OK"
+    assert response.headers.get("content-type") == "text/plain"
+    expected_origin = ORIGIN_HEADER["Origin"] if cookie else "*"
+    assert response.headers.get(CORS_RESPONSE_HEADER) == expected_origin
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("cookie", [False, True], ids=["simple", "explicit-origin"])
+async def test_downstream_cors_header_is_replaced(cookie: bool):
+    """
+    Test that CustomCORSMiddleware replaces an allow-origin header already set
+    by the downstream app instead of sending two values.
+    """
+    async def raw_app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"access-control-allow-origin", b"https://x.com")],
+        })
+        await send({"type": "http.response.body", "body": b"OK"})
+
+    middleware = CustomCORSMiddleware(app=raw_app, allow_origins=["*"], allow_credentials=True)
+    transport = httpx.ASGITransport(app=middleware)
+    headers = {**ORIGIN_HEADER, "Cookie": "session=abc"} if cookie else ORIGIN_HEADER
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.get("/", headers=headers)
+
+    expected_origin = ORIGIN_HEADER["Origin"] if cookie else "*"
+    assert response.headers.get_list(CORS_RESPONSE_HEADER) == [expected_origin]
+
+@pytest.mark.anyio
+async def test_first_origin_header_wins():
+    """
+    Test that with repeated Origin headers CustomCORSMiddleware uses the first
+    one, as Headers.get does.
+    """
+    origin = ORIGIN_HEADER["Origin"]
+    middleware = CustomCORSMiddleware(app=ok_app, allow_origins=[origin])
+    transport = httpx.ASGITransport(app=middleware)
+    headers = [("Origin", origin), ("Origin", "https://example.com")]
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.get("/", headers=headers)
+
+    assert response.headers.get(CORS_RESPONSE_HEADER) == origin
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("options, cookie, expected", [
+    pytest.param({"allow_origins": ["*"]}, True, "*", id="allow-all-cookie"),
+    pytest.param({"allow_origins": ["*"], "allow_credentials": True}, True, ORIGIN_HEADER["Origin"], id="allow-all-credentials-cookie"),
+    pytest.param({"allow_origins": ["*"], "allow_credentials": True}, False, "*", id="allow-all-credentials"),
+    pytest.param({"allow_origins": [ORIGIN_HEADER["Origin"]]}, False, ORIGIN_HEADER["Origin"], id="allow-list"),
+])
+async def test_origin_mirroring(options: dict, cookie: bool, expected: str):
+    """
+    Test that CustomCORSMiddleware mirrors back the origin only where its
+    configuration calls for it.
+    """
+    middleware = CustomCORSMiddleware(app=ok_app, **options)
+    transport = httpx.ASGITransport(app=middleware)
+    headers = {**ORIGIN_HEADER, "Cookie": "session=abc"} if cookie else ORIGIN_HEADER
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.get("/", headers=headers)
+
+    assert response.headers.get(CORS_RESPONSE_HEADER) == expected